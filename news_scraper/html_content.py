@@ -2,10 +2,29 @@
 Module for cleaning HTML content using the newspaper library.
 """
 import html
-import re
 import newspaper
 from lxml import html as h
 
+_CTRL_TABLE = {
+    c: 0x20 for c in (
+        list(range(0x00, 0x09)) + [0x0B, 0x0C] +
+        list(range(0x0E, 0x20)) + [0x7F]
+    )
+}
+
+_BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "ol", "p", "pre", "section", "table", "td",
+    "th", "tr", "ul",
+))
+_SKIP_TAGS = frozenset(("script", "style", "template"))
+
+_NP_CONFIG = newspaper.Config()
+_NP_CONFIG.language = "gl"
+_NP_CONFIG.memorize_articles = False
+_NP_CONFIG.fetch_images = False
+
 
 def clean_chars(content):
     """
@@ -14,11 +33,7 @@ def clean_chars(content):
     if isinstance(content, (bytes, bytearray)):
         content = content.decode("utf-8", errors="replace")
 
-    return re.sub(
-        r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]",
-        " ",
-        content
-    ).strip()
+    return content.translate(_CTRL_TABLE).strip()
 
 
 def clean_html_body(html_content):
@@ -33,14 +48,17 @@ def clean_html_body(html_content):
         raise RuntimeError("Empty content in HTML.")
 
     try:
-        art = newspaper.article(url="https://praza.gal", input_html=cleaned)
-        html_cleaned = art.to_json(as_string=False).get('text', '')
+        art = newspaper.Article(url="https://praza.gal", config=_NP_CONFIG)
+        art.download(input_html=cleaned)
+        art.parse()
+        html_cleaned = art.text
     except Exception:
         html_cleaned = ""
 
     if not html_cleaned:
         try:
-            html_cleaned = newspaper.fulltext(cleaned).strip()
+            html_cleaned = newspaper.fulltext(
+                cleaned, language=_NP_CONFIG.language).strip()
         except Exception:
             html_cleaned = ""
 
@@ -50,15 +68,57 @@ def clean_html_body(html_content):
     return html_cleaned
 
 
+def extract_text_from_node(node):
+    """
+    Extracts the text of an already located article body, skipping the
+    newspaper heuristics. All the text of the subtree is kept: each
+    block-level element (paragraph, heading, list item, quote...) and
+    any loose text between them becomes its own paragraph.
+
+    :param: node: lxml element containing the article body.
+    :returns: str: The blocks of the body separated by blank lines.
+    """
+    blocks = []
+    parts = []
+
+    def flush():
+        text = " ".join("".join(parts).split())
+        if text:
+            blocks.append(text)
+        parts.clear()
+
+    def walk(elem):
+        tag = elem.tag if isinstance(elem.tag, str) else None
+        if tag == "br":
+            parts.append(" ")
+        elif tag is not None and tag not in _SKIP_TAGS:
+            block = tag in _BLOCK_TAGS
+            if block:
+                flush()
+            if elem.text:
+                parts.append(elem.text)
+            for child in elem:
+                walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+            if block:
+                flush()
+
+    walk(node)
+    flush()
+    return "\n\n".join(blocks)
+
+
 def clean_html_abstract(html_content):
     """
-    Extracts and cleans the abstract from the given HTML content.
+    Extracts and cleans the abstract from the given HTML fragment.
 
-    :param: html_content (str): The raw HTML content.
+    :param: html_content (str): The raw HTML fragment.
     :returns: str: The cleaned abstract text extracted from the HTML.
     """
     return " ".join(
-        h.fromstring(html_content).text_content().split())
+        h.fragment_fromstring(html_content, create_parent="div")
+        .text_content().split())
 
 
 def prepare_html(html_content):
@@ -67,10 +127,13 @@ def prepare_html(html_content):
     :param html_content: Raw HTML content
     :returns: Prepared HTML content as a string
     """
-    pattern = r'<(/?)(strong)>'
-    html_content = re.sub(pattern, "", html_content)
-    html_content = re.sub(r'<p><br>\n', '<p>', html_content)
-    html_content = re.sub(r'<p>\n\t', '<p>', html_content)
+    html_content = (
+        html_content
+        .replace("<strong>", "")
+        .replace("</strong>", "")
+        .replace("<p><br>\n", "<p>")
+        .replace("<p>\n\t", "<p>")
+    )
     return (
         "<html><body><p class='article'>" +
         (html.unescape(html_content.strip()) if html_content else "") +
@@ -1,18 +1,37 @@
 """
 Parse data from NÓS Diário using XML files
 """
-import json
+import html
 import logging
-import xml.etree.ElementTree as ET
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import orjson
+from lxml import etree as LET
 from lxml import html as h
 from news_scraper.html_content import (
-    clean_html_body, clean_html_abstract, prepare_html
+    clean_html_body, clean_html_abstract, extract_text_from_node,
+    prepare_html
 )
 from news_scraper.request import Request
 
 logger = logging.getLogger(__name__)
 
+_XP_NEWSID = LET.XPath(".//NewsIdentifier")
+_XP_NEWSMGMT = LET.XPath(".//NewsManagement")
+_XP_BODY_CONTENT = LET.XPath(".//body.content")
+_XP_IN_ARTICLE_BODY = LET.XPath(
+    "boolean(parent::body/parent::nitf/parent::DataContent"
+    "/parent::ContentItem[@type='article'])"
+)
+_XP_ABSTRACT = LET.XPath(".//abstract/p")
+_XP_IN_ARTICLE_ABSTRACT = LET.XPath(
+    "boolean(parent::abstract/parent::body.head/parent::body/parent::nitf"
+    "/parent::DataContent/parent::ContentItem[@type='article'])"
+)
+_XP_RELATED_DIV = LET.XPath(".//div[contains(@class, 'related-content')]")
+_XP_RELATED_LINKS = LET.XPath(".//ul//a")
+
 
 class NosDiario():
     """
@@ -21,10 +40,40 @@ class NosDiario():
     def __init__(self, config):
         self.config = config
         self.url = None
-        self.r = Request()
+        self._r = None
         self.articles_ok = 0
         self.articles_error = 0
         self.articles_exists = 0
+        self._mkdir_cache = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def r(self):
+        """
+        Cliente HTTP, creado no primeiro uso para que parsear non abra
+        sesións nin resolva nomes.
+        """
+        if self._r is None:
+            self._r = Request(
+                pool_connections=int(
+                    self.config.get("pool_connections", 8)),
+                pool_maxsize=int(self.config.get("pool_maxsize", 32)),
+                base_url=self.config.get("base_url"),
+                backend=self.config.get("backend", "requests"),
+            )
+        return self._r
+
+    def close(self):
+        """
+        Pecha as conexións HTTP abertas.
+        """
+        if self._r is not None:
+            self._r.close()
 
     def download(self, url):
         """
@@ -35,43 +84,95 @@ class NosDiario():
         """
         raise NotImplementedError("Download method is not implemented yet.")
 
-    def parse(self, xml_files):
+    def parse(self, xml_files, workers=None):
         """
-        Parsea o HTML duma nova e extrae os dados relevantes.
+        Parsea os XML das novas en paralelo e extrae os dados relevantes.
 
-        :params: html_file: ficheiro HTML da nova
+        :params: xml_files: ficheiros XML das novas
+        :params: workers: número de procesos (por defecto, os CPUs)
         :returns: none:
         """
-        for xml_path in xml_files:
-            logger.info("Parsing file: %s", xml_path)
-            doc = {}
+        xml_files = list(xml_files)
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(xml_files) // (4 * workers))
+        logger.info(
+            "Parsing %d files with %d workers", len(xml_files), workers)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(dict(self.config),),
+        ) as ex:
+            for result in ex.map(
+                _parse_one, xml_files, chunksize=chunksize
+            ):
+                if result is True:
+                    self.articles_ok += 1
+                elif result is False:
+                    self.articles_error += 1
+
+    def _parse_file(self, xml_path):
+        """
+        Parsea o XML duma nova e escreve o JSON resultante.
+
+        :params: xml_path: ficheiro XML da nova
+        :returns: True se foi parseado, False se houbo erro, None se
+            o ficheiro foi ignorado
+        """
+        xml_path = Path(xml_path)
+        logger.info("Parsing file: %s", xml_path)
+        doc = {}
+
+        if xml_path.stat().st_size == 0:
+            logger.warning("Skipping empty file: %s", xml_path)
+            return None
 
-            if xml_path.stat().st_size == 0:
-                logger.warning("Skipping empty file: %s", xml_path)
-                continue
+        try:
+            tree = self._read_news_item(xml_path)
+        except LET.XMLSyntaxError as e:
+            logger.error("Error parsing XML file %s: %s", xml_path, e)
+            return None
 
-            try:
-                root = ET.parse(xml_path)
-                tree = root.getroot()
-            except ET.ParseError as e:
-                logger.error("Error parsing XML file %s: %s", xml_path, e)
-                continue
-
-            doc.update({"metadata": self._get_metadata(tree)})
-            news = self._parse_article(tree)
-            if not news:
-                logger.error("Error parsing article in file %s", xml_path)
-                self.articles_error += 1
-                continue
-
-            url = self._get_url(tree, news["categories"][0])
-            if url:
-                doc["metadata"]["url"] = url
-
-            doc.update({"news": news})
-            doc.update({"source_xml": str(xml_path.name)})
-            self._write_json(doc, xml_path)
-            self.articles_ok += 1
+        nid = _XP_NEWSID(tree)
+        identifier = nid[0] if nid else None
+        doc.update({"metadata": self._get_metadata(tree, identifier)})
+        news = self._parse_article(tree)
+        if not news:
+            logger.error("Error parsing article in file %s", xml_path)
+            return False
+
+        url = self._get_url(identifier, news["categories"][0])
+        if url:
+            doc["metadata"]["url"] = url
+
+        doc.update({"news": news})
+        doc.update({"source_xml": str(xml_path.name)})
+        self._write_json(doc, xml_path)
+        return True
+
+    def _read_news_item(self, xml_path):
+        """
+        Incrementally read the NewsItem element from the XML file.
+
+        Parsing stops as soon as the NewsItem is complete, and anything
+        read before it (e.g. the NewsEnvelope) is released.
+        :param xml_path: Path to the XML file
+        :returns: NewsItem element, or the root if there is none
+        """
+        with open(xml_path, "rb") as f:
+            context = LET.iterparse(
+                f,
+                events=("end",),
+                tag="NewsItem",
+                huge_tree=False,
+                remove_blank_text=True,
+            )
+            for _, elem in context:
+                parent = elem.getparent()
+                while elem.getprevious() is not None:
+                    del parent[0]
+                return elem
+            return context.root
 
     def _parse_article(self, tree):
         """
@@ -100,12 +201,13 @@ class NosDiario():
         if abstract:
             data["abstract"] = abstract
 
-        body_html = self._get_html_body(tree)
-        if not body_html.strip():
+        body_elem = self._get_html_body(tree)
+        if body_elem is None:
             return None
-        related, body_html = self._get_related(body_html)
+        related = self._get_related(body_elem)
+        body_html = self._serialize_body(body_elem)
         data["body_html"] = body_html
-        body = self._get_body(body_html)
+        body = self._get_body(body_elem, body_html)
         data["body"] = body
         if related:
             data["related"] = related
@@ -124,19 +226,27 @@ class NosDiario():
 
         return data
 
-    def _get_metadata(self, tree):
+    def _get_metadata(self, tree, identifier):
         """
         Extract metadata from the XML root element.
         :param tree: XML document
+        :param identifier: NewsIdentifier element, if any
         :returns: Dictionary with metadata
         """
+        nmgmt = _XP_NEWSMGMT(tree)
+        mgmt = nmgmt[0] if nmgmt else None
         return {
-            "news_item_id": tree.findtext(".//NewsIdentifier/NewsItemId"),
-            "first_created": tree.findtext(".//NewsManagement/FirstCreated"),
-            "first_published": tree.findtext(
-                ".//NewsManagement/FirstPublished"),
-            "this_revision_created": tree.findtext(
-                ".//NewsManagement/ThisRevisionCreated"),
+            "news_item_id": (
+                identifier.findtext("NewsItemId")
+                if identifier is not None else None),
+            "first_created": (
+                mgmt.findtext("FirstCreated") if mgmt is not None else None),
+            "first_published": (
+                mgmt.findtext("FirstPublished")
+                if mgmt is not None else None),
+            "this_revision_created": (
+                mgmt.findtext("ThisRevisionCreated")
+                if mgmt is not None else None),
         }
 
     def _get_headlines(self, tree):
@@ -169,16 +279,19 @@ class NosDiario():
                 categories.add(category.attrib.get("Value"))
         return list(categories)
 
-    def _get_url(self, tree, category):
+    def _get_url(self, identifier, category):
         """
         Construct the URL for the news article.
-        :param tree: XML root element
+        :param identifier: NewsIdentifier element
         :param category: Category of the news article
         :returns: Constructed URL as a string
         """
-        uid = tree.findtext(".//NewsIdentifier/NewsItemId")
-        date_id = tree.findtext(
-            ".//NewsIdentifier/DateId").split("+")[0].replace("T", "")
+        if identifier is None:
+            return None
+
+        uid = identifier.findtext("NewsItemId")
+        date_id = identifier.findtext(
+            "DateId").split("+")[0].replace("T", "")
 
         return (
             f"{self.config["base_url"]}/articulo/"
@@ -193,16 +306,12 @@ class NosDiario():
         :returns: abstract as a string
         """
         abstract = ""
-        abstract_html = tree.findtext(
-            ".//ContentItem[@type='article']/DataContent/nitf/body/body.head/abstract/p"  # noqa
-        ) or tree.findtext(
-            ".//abstract/p"
-        )
+        abstract_html = self._find_text(
+            tree, _XP_ABSTRACT, _XP_IN_ARTICLE_ABSTRACT)
 
         if abstract_html:
-            raw_abstract = prepare_html(abstract_html)
             try:
-                abstract = clean_html_abstract(raw_abstract.strip())
+                abstract = clean_html_abstract(abstract_html.strip())
                 if not abstract:
                     raise RuntimeError("abstract is empty after cleaning.")
             except RuntimeError as e:
@@ -210,27 +319,57 @@ class NosDiario():
 
         return abstract
 
+    def _find_text(self, tree, xp_nodes, xp_in_article):
+        """
+        Find the text of an element in a single walk of the tree,
+        preferring the one that belongs to the article ContentItem.
+        :param tree: XML root element
+        :param xp_nodes: XPath returning every candidate element
+        :param xp_in_article: XPath telling if a candidate is in the article
+        :returns: text of the chosen element, or None
+        """
+        nodes = xp_nodes(tree)
+        for node in nodes:
+            if node.text and xp_in_article(node):
+                return node.text
+        return nodes[0].text if nodes else None
+
     def _get_html_body(self, tree):
         """
         Extract the raw HTML body from the XML root element.
         :param tree: XML root element
-        :returns: Raw HTML body as a string
+        :returns: HTML body parsed under a wrapping div, or None if empty
+        """
+        body_html = self._find_text(
+            tree, _XP_BODY_CONTENT, _XP_IN_ARTICLE_BODY)
+        if not body_html or not body_html.strip():
+            return None
+        return h.fragment_fromstring(body_html, create_parent="div")
+
+    def _serialize_body(self, body_elem):
+        """
+        Serialize the contents of the wrapping div back to HTML.
+        :param body_elem: HTML body element
+        :returns: HTML body as a string
         """
-        body_html = tree.findtext(
-            ".//ContentItem[@type='article']/DataContent/nitf/body/body.content"  # noqa
-        ) or tree.findtext(
-            ".//body.content"
+        return "".join(
+            [html.escape(body_elem.text or "", quote=False)] +
+            [h.tostring(c, encoding="unicode") for c in body_elem]
         )
-        return body_html
 
-    def _get_body(self, body_html):
+    def _get_body(self, body_elem, body_html):
         """
-        Extract the body from the XML root element.
-        :param body_html: XML root element
-        :param xml_path: Path to the XML file
-        :returns: Tuple with cleaned body and raw HTML body
+        Extract the body text from the parsed HTML body, keeping the
+        loose leading text, subheadings, list items and quotes as well as
+        the paragraphs. newspaper is only used if that yields nothing.
+        :param body_elem: HTML body element
+        :param body_html: HTML body as a string, used by the fallback
+        :returns: cleaned body text
         """
-        body = ""
+        body = extract_text_from_node(body_elem)
+        if body:
+            return body
+
         raw_body = prepare_html(body_html)
         try:
             body = clean_html_body(raw_body)
@@ -239,17 +378,16 @@ class NosDiario():
 
         return body
 
-    def _get_related(self, body):
+    def _get_related(self, doc):
         """
-        Extract related articles from the HTML body
-        :param body: HTML body content (str)
-        :returns: List of related articles and cleaned body
+        Extract related articles from the HTML body, removing them from it
+        :param doc: HTML body element
+        :returns: List of related articles
         """
         related_uris = []
-        doc = h.fromstring(f"<html><body>{body}</body></html>")
 
-        for div in doc.xpath("//div[contains(@class, 'related-content')]"):
-            for a in div.xpath(".//ul//a"):
+        for div in _XP_RELATED_DIV(doc):
+            for a in _XP_RELATED_LINKS(div):
                 href = a.get("href")
                 text = "".join(a.itertext()).strip()
                 if href:
@@ -265,10 +403,7 @@ class NosDiario():
             if parent is not None:
                 parent.remove(div)
 
-        body = h.tostring(doc, encoding="unicode").replace(
-            "<html><body>", "").replace("</body></html>", "")
-
-        return related_uris, body
+        return related_uris
 
     def _get_newsid(self, url):
         """
@@ -276,7 +411,7 @@ class NosDiario():
         :param url: URL string
         :returns: News ID as a string
         """
-        return url.split("/")[-1].replace(".html", "")[14:]
+        return url.rpartition("/")[2].removesuffix(".html")[14:]
 
     def _get_keywords(self, tree):
         """
@@ -342,7 +477,31 @@ class NosDiario():
             self.config["corpus"]) / xml_file.relative_to(
                 Path(self.config["source"])
             ).with_suffix(".json")
-        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.parent not in self._mkdir_cache:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            self._mkdir_cache.add(dst.parent)
 
-        dst.write_text(
-            json.dumps(doc, ensure_ascii=False, indent=4), encoding="utf-8")
+        dst.write_bytes(orjson.dumps(doc, option=orjson.OPT_INDENT_2))
+
+
+_worker = None
+
+
+def _init_worker(config):
+    """
+    Create the NosDiario instance used by a worker process.
+
+    :param config: scraper configuration as a plain dict
+    """
+    global _worker
+    _worker = NosDiario(config)
+
+
+def _parse_one(xml_path):
+    """
+    Parse one XML file in a worker process.
+
+    :param xml_path: Path to the XML file
+    :returns: result of NosDiario._parse_file
+    """
+    return _worker._parse_file(xml_path)
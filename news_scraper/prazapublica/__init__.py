@@ -1,4 +1,4 @@
 """
 Init file for the package.
 """
-from .praza import Praza, CATEGORIES
+from .praza import Praza, CATEGORIES, CATEGORY_NAMES
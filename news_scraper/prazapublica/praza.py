@@ -2,11 +2,18 @@
 Class to download and parse data from Praza Pública.
 """
 import hashlib
-import json
 import logging
+import os
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+)
 from pathlib import Path
+import orjson
+from lxml import etree as LET
 from lxml import html as h
-from news_scraper.html_content import clean_html_body, prepare_html
+from news_scraper.html_content import (
+    clean_html_body, extract_text_from_node, prepare_html
+)
 from news_scraper.request import Request, RequestError
 
 
@@ -21,99 +28,228 @@ CATEGORIES = {
     "Economía": "https://praza.gal/economia/todo?p={}",
     "Movementos sociais": "https://praza.gal/movementos-sociais/todo?p={}"
 }
+CATEGORY_NAMES = tuple(sorted(CATEGORIES))
 
 logger = logging.getLogger(__name__)
 
+_HTML_PARSER = h.HTMLParser(
+    remove_comments=True,
+    remove_pis=True,
+    remove_blank_text=True,
+    encoding="utf-8",
+)
+
+_XP_ARTICLE_UL = LET.XPath("//article[@id='article']//ul")
+_XP_RELATED = LET.XPath(".//ul[contains(@class, 'at-archive-refs-list')]")
+_XP_REF_LINKS = LET.XPath(".//h1[contains(@class, 'ref-title')]/a")
+_XP_ARTICLE_BODY = LET.XPath("//div[contains(@class, 'article-body')]")
+_XP_FIGURES = LET.XPath("//figure[contains(@class, 'at-image')]")
+_XP_FIGCAPTION = LET.XPath(".//figcaption//text()")
+_XP_LINK = LET.XPath(".//a[@href]")
+_XP_CATS = LET.XPath(
+    ".//a[@class='topic' or @class='area' or @class='local-edition']")
+_XP_TEXT = LET.XPath(".//text()")
+_XP_META_PROPERTY = LET.XPath("//meta[@property=$prop]/@content")
+_XP_META_NAME = LET.XPath("//meta[@name=$name]/@content")
+_XP_ARTICLES_LIST = LET.XPath(
+    '//ul[contains(@class, "articles-list")]//article')
+_XP_HEADLINE_HREF = LET.XPath(
+    './/h2[contains(@class, "headline")]/a/@href')
+_XP_DATE = LET.XPath('.//time[contains(@class, "date")]/@datetime')
+_XP_PAGINATION = LET.XPath(
+    '//nav[contains(@class, "at-pagination")]'
+    '//a[contains(@class, "pagination-link")]'
+)
+
 
 class Praza():
     """
     Class to download and parse articles from Praza Pública.
     """
-    def __init__(self, config):
+    def __init__(self, config, max_workers=8):
         self.config = config
         self.categories = CATEGORIES.keys()
         self.url = None
-        self.r = Request()
+        self._r = None
+        self.max_workers = max_workers
         self.articles_ok = 0
         self.articles_error = 0
         self.articles_exists = 0
+        self._mkdir_cache = set()
+        self._first_pages = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def r(self):
+        """
+        Cliente HTTP, creado no primeiro uso para que parsear non abra
+        sesións nin resolva nomes.
+        """
+        if self._r is None:
+            self._r = Request(
+                pool_connections=int(
+                    self.config.get("pool_connections", 8)),
+                pool_maxsize=int(self.config.get("pool_maxsize", 32)),
+                base_url=self.config.get("base_url"),
+                backend=self.config.get("backend", "requests"),
+            )
+        return self._r
+
+    def close(self):
+        """
+        Pecha as conexións HTTP abertas.
+        """
+        if self._r is not None:
+            self._r.close()
 
-    def download_from_category(self, category):
+    def download_from_category(self, category, force=False):
         """
         Download all articles in a given category.
         :params: category: category to download
+        :params: force: download again the articles already on disk
         :returns: None
         """
-        if category not in self.categories:
-            raise ValueError(f"Invalid category: {category}")
+        self.download_urls(self.iter_category_urls([category]), force)
 
-        page = 1
-        try:
-            response = self.r.fetch(CATEGORIES[category].format(page))
-        except RequestError as e:
-            logger.error("Error downloading category: %s", e)
-
-        tree = h.fromstring(response)
-        last_page = self._get_category_end(tree)
-        logger.info("Category %s with %d pages", category, last_page)
+    def iter_category_urls(self, categories):
+        """
+        Yield the URLs of every listing page of the given categories.
+        The first page of each category is fetched concurrently to find
+        its pagination, and kept so that download_urls does not fetch
+        it again.
+        :params: categories: categories to download
+        :returns: iterator of listing page URLs
+        """
+        for category in categories:
+            if category not in self.categories:
+                raise ValueError(f"Invalid category: {category}")
 
-        self._get_articles_in_page(tree)
-        logger.info("Finished page %d", page)
-        for page in range(2, last_page + 1):
-            try:
-                response = self.r.fetch(CATEGORIES[category].format(page))
-            except RequestError as e:
-                logger.error("Error downloading category page: %s", e)
+        firsts = {CATEGORIES[c].format(1): c for c in categories}
+        for url, response in self.r.fetch_many(firsts):
+            category = firsts[url]
+            if response is None:
+                logger.error("Error downloading category: %s", category)
+                continue
 
             tree = h.fromstring(response)
-            self._get_articles_in_page(tree)
-            logger.info("Finished page %d", page)
+            last_page = self._get_category_end(tree)
+            logger.info("Category %s with %d pages", category, last_page)
+
+            self._first_pages[url] = tree
+            tpl = CATEGORIES[category]
+            for page in range(1, last_page + 1):
+                yield tpl.format(page)
+
+    def download_urls(self, urls, force=False):
+        """
+        Download the articles linked from a set of listing pages, with
+        one pool shared by all of them.
+        :params: urls: listing page URLs, as from iter_category_urls
+        :params: force: download again the articles already on disk
+        :returns: None
+        """
+        pages = []
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            downloads = {}
+            for url in urls:
+                tree = self._first_pages.pop(url, None)
+                if tree is None:
+                    pages.append(url)
+                    continue
+
+                downloads.update(self._get_articles_in_page(
+                    tree, ex, seen, force))
+                logger.info("Finished page %s", url)
+
+            for url, response in self.r.fetch_many(pages, ex):
+                if response is None:
+                    logger.error("Error downloading category page: %s", url)
+                    continue
+
+                tree = h.fromstring(response)
+                downloads.update(self._get_articles_in_page(
+                    tree, ex, seen, force))
+                logger.info("Finished page %s", url)
+
+            for future in as_completed(downloads):
+                result, msg = future.result()
+                self._count_download(downloads[future], result, msg)
+
         logger.info(
-            "Category %s: downloaded %d articles (%d skipped) with %d errors",
-            category,
+            "Downloaded %d articles (%d skipped) with %d errors",
             self.articles_ok + self.articles_exists,
             self.articles_exists,
             self.articles_error
         )
 
-    def parse(self, html_files):
+    def parse(self, html_files, workers=None):
         """
-        Parsea o HTML duma nova e extrae os dados relevantes.
+        Parsea os HTML das novas en paralelo e extrae os dados relevantes.
 
-        :params: html_file: ficheiro HTML da nova
+        :params: html_files: ficheiros HTML das novas
+        :params: workers: número de procesos (por defecto, os CPUs)
         :returns: none:
         """
-        for html_file in html_files:
-            logger.info("Parsing file: %s", html_file)
-            doc = {}
+        html_files = list(html_files)
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(html_files) // (4 * workers))
+        logger.info(
+            "Parsing %d files with %d workers", len(html_files), workers)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(dict(self.config),),
+        ) as ex:
+            for result in ex.map(
+                _parse_one, html_files, chunksize=chunksize
+            ):
+                if result:
+                    self.articles_ok += 1
+                else:
+                    self.articles_error += 1
 
-            try:
-                html_content = self._get_content(html_file)
-            except Exception as e:
-                logger.error("%s", e)
-                self.articles_error += 1
-                continue
+    def _parse_file(self, html_file):
+        """
+        Parsea o HTML duma nova e escreve o JSON resultante.
 
-            try:
-                tree = h.fromstring(html_content)
-            except Exception as e:
-                logger.error("Error parsing HTML content: %s", e)
-                self.articles_error += 1
-                continue
+        :params: html_file: ficheiro HTML da nova
+        :returns: bool: True se foi parseado sen erros
+        """
+        html_file = Path(html_file)
+        logger.info("Parsing file: %s", html_file)
+        doc = {}
 
-            doc.update({"metadata": self._get_metadata(tree)})
+        try:
+            html_content = self._get_content(html_file)
+        except Exception as e:
+            logger.error("%s", e)
+            return False
 
-            news = self._parse_article(tree)
-            if not news:
-                logger.error("Error parsing article in file %s", html_file)
-                self.articles_error += 1
-                continue
+        try:
+            tree = h.fromstring(html_content, parser=_HTML_PARSER)
+        except Exception as e:
+            logger.error("Error parsing HTML content: %s", e)
+            return False
+
+        doc.update({"metadata": self._get_metadata(tree)})
 
-            doc.update({"news": news})
-            doc.update({"source": str(html_file)})
+        news = self._parse_article(tree)
+        if not news:
+            logger.error("Error parsing article in file %s", html_file)
+            return False
 
-            self._write_json(doc, html_file)
-            self.articles_ok += 1
+        doc.update({"news": news})
+        doc.update({"source": str(html_file)})
+
+        self._write_json(doc, html_file)
+        return True
 
     def _write_json(self, doc, html_file):
         """
@@ -125,10 +261,11 @@ class Praza():
             self.config["corpus"]) / html_file.relative_to(
                 Path(self.config["source"])
             ).with_suffix(".json")
-        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.parent not in self._mkdir_cache:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            self._mkdir_cache.add(dst.parent)
 
-        dst.write_text(
-            json.dumps(doc, ensure_ascii=False, indent=4), encoding="utf-8")
+        dst.write_bytes(orjson.dumps(doc, option=orjson.OPT_INDENT_2))
 
     def _get_related(self, tree):
         """
@@ -141,9 +278,9 @@ class Praza():
         if not tree:
             return related
 
-        for link in tree[0].xpath(".//h1[contains(@class, 'ref-title')]/a"):
+        for link in _XP_REF_LINKS(tree[0]):
             href = link.get("href").strip()
-            text = link.xpath(".//text()")[0].strip()
+            text = _XP_TEXT(link)[0].strip()
             related.append(
                 {
                     "link": self.config["base_url"] + href,
@@ -166,18 +303,14 @@ class Praza():
 
         title = self._get_title(tree)
         abstract = self._get_abstract(tree)
-        category, topics, loc = self._get_categories(
-            tree.xpath("//article[@id='article']//ul")
-        )
-        related = self._get_related(tree.xpath(
-            ".//ul[contains(@class, 'at-archive-refs-list')]")
-        )
-        body_html = self._get_htmlbody(tree)
+        category, topics, loc = self._get_categories(_XP_ARTICLE_UL(tree))
+        related = self._get_related(_XP_RELATED(tree))
+        article_body = _XP_ARTICLE_BODY(tree)
+        body_html = self._get_htmlbody(article_body)
         if body_html is None:
             return None
 
-        body = self._get_bodytext(
-            tree.xpath(".//div[contains(@class, 'ml-article-single')]"))
+        body = self._get_bodytext(article_body[0])
         if body is None:
             return None
         images = self._get_images(tree)
@@ -200,14 +333,13 @@ class Praza():
 
         return data
 
-    def _get_htmlbody(self, tree):
+    def _get_htmlbody(self, article_body):
         """
         Extrae o contido HTML da nova.
 
-        :params: tree: árvore do artigo
+        :params: article_body: nós do corpo do artigo
         :returns: str: contido HTML extraído
         """
-        article_body = tree.xpath("//div[contains(@class, 'article-body')]")
         if article_body:
             return h.tostring(article_body[0], encoding="unicode")
         logger.warning("No article body found in article %s", self.url)
@@ -218,13 +350,13 @@ class Praza():
         """
         Extrae o contido en texto da nova.
 
-        :params: tree: árvore do artigo
+        :params: article: nó do corpo do artigo
         :returns: str: conteúdo do texto extraído
         """
-        if not article:
-            logger.warning("No article body found in article %s", self.url)
-            return None
-        article = article[0]
+        body = extract_text_from_node(article)
+        if body:
+            return body
+
         try:
             article = prepare_html(h.tostring(article, encoding="unicode"))
             body = clean_html_body(article)
@@ -242,11 +374,11 @@ class Praza():
         :returns: list: URLs das imagens extraídas
         """
         images = []
-        for fig in tree.xpath("//figure[contains(@class, 'at-image')]"):
-            caption = fig.xpath(".//figcaption//text()")
+        for fig in _XP_FIGURES(tree):
+            caption = _XP_FIGCAPTION(fig)
             if caption:
                 caption = caption[0].strip()
-            link = fig.xpath(".//a[@href]")
+            link = _XP_LINK(fig)
             if link:
                 images.append({
                     "url": link[0].get("href"),
@@ -265,17 +397,18 @@ class Praza():
         topics = []
         loc = None
         category = None
-        if article:
-            article = article[0]
+        if not article:
+            return "", "", ""
 
-        for link in article.xpath(".//a"):
-            cls = link.get("class", "")
+        for link in _XP_CATS(article[0]):
+            cls = link.get("class")
+            text = link.text_content().strip()
             if cls == "topic":
-                topics.append(link.text_content().strip())
+                topics.append(text)
             elif cls == "area":
-                category = link.text_content().strip()
-            elif cls == "local-edition":
-                loc = link.text_content().strip()
+                category = text
+            else:
+                loc = text
         return category or "", topics or "", loc or ""
 
     def _get_content(self, html_file):
@@ -283,11 +416,10 @@ class Praza():
         Lê o conteúdo HTML dende o ficheiro.
 
         :params: html_file: ficheiro HTML
-        :returns: str: conteúdo HTML
+        :returns: bytes: conteúdo HTML
         """
         try:
-            with html_file.open("r", encoding="utf-8") as f:
-                return f.read()
+            return html_file.read_bytes()
         except OSError as e:
             raise OSError(f"Error reading HTML file {html_file}") from e
         except Exception as e:
@@ -301,7 +433,7 @@ class Praza():
         :params: prop: propiedade a extraer
         :returns: str: valor da propiedade
         """
-        result = tree.xpath(f"//meta[@property='{prop}']/@content")
+        result = _XP_META_PROPERTY(tree, prop=prop)
         if result:
             return result[0].strip()
         return None
@@ -314,7 +446,7 @@ class Praza():
         :params: name: nome a extraer
         :returns: str: valor do nome
         """
-        result = tree.xpath(f"//meta[@name='{name}']/@content")
+        result = _XP_META_NAME(tree, name=name)
         if result:
             return result[0].strip()
         return None
@@ -349,7 +481,8 @@ class Praza():
         :params: url: URL da nova
         :returns: str: ID único
         """
-        return hashlib.md5(url.encode("utf-8")).hexdigest()
+        return hashlib.md5(
+            url.encode("utf-8"), usedforsecurity=False).hexdigest()
 
     def _get_title(self, tree):
         """
@@ -360,13 +493,12 @@ class Praza():
         """
         title = (
             self._get_property(tree, "og:title") or
-            self._get_name(tree, "title") or
-            logger.warning(
-                "No title found in article %s", self.url)
+            self._get_name(tree, "title")
         )
-        if title:
-            return title.replace(" - Praza Pública", "").strip()
-        return ""
+        if not title:
+            logger.warning("No title found in article %s", self.url)
+            return ""
+        return title.replace(" - Praza Pública", "").strip()
 
     def _get_abstract(self, tree):
         """
@@ -377,24 +509,29 @@ class Praza():
         """
         abstract = (
             self._get_property(tree, "og:description") or
-            self._get_name(tree, "description") or
-            logger.warning(
-                "No description found in article %s", self.url)
+            self._get_name(tree, "description")
         )
-        if abstract:
-            return abstract.strip()
-        return None
+        if not abstract:
+            logger.warning("No description found in article %s", self.url)
+            return None
+        return abstract.strip()
 
-    def _download_article(self, url, isodate):
+    def _download_article(self, url, isodate, force=False):
         """
         Descarrega a nova da URI e almacena o HTML, organizando os dados por
-        ano e mes.
+        ano e mes. Os ficheiros non baleiros xa descarregados non se volven
+        descarregar, agás con force.
 
         :params: url: URI para descarregar
         :params: isodate: data en formato ISO 8601
+        :params: force: descarregar aínda que o ficheiro xa exista
         :returns: boolean: resultado da descarga
         """
-        (year, month, day) = isodate.split('.')[0].split("T")[0].split("-")
+        try:
+            (year, month, day) = (
+                isodate.split('.')[0].split("T")[0].split("-"))
+        except ValueError:
+            return False, f"invalid date: {isodate}"
 
         try:
             out_dir = Path(self.config["source"]) / str(year) / str(month)
@@ -404,60 +541,97 @@ class Praza():
 
         filename = f"praza_{year + month + day}_{url.split("/")[-1]}.html"
         out_path = out_dir / Path(filename).name
-        if out_path.exists():
+        if not force and self._exists(out_path):
             logger.debug("File %s already exists, skipping download", out_path)
             return True, "exists"
 
         try:
-            content = self.r.fetch(str(url))
+            size = self.r.fetch_to_file(str(url), out_path)
         except RequestError as e:
             logger.error("Error downloading article: %s", e)
             return False, str(e)
+        except OSError as e:
+            return False, str(e)
 
-        if not content or len(content) == 0:
+        if not size:
             logger.warning("Empty content for URI %s", url)
             return False, "empty_content"
 
-        try:
-            with out_path.open("w") as f:
-                f.write(content)
-        except Exception as e:
-            return False, str(e)
-
         return True, "ok"
 
-    def _get_articles_in_page(self, tree):
+    def _exists(self, path):
         """
-        Get links from the category index and download each article.
+        Check whether a non-empty file was already downloaded to path.
+
+        :params: path: path of the downloaded file
+        :returns: bool
+        """
+        try:
+            return path.stat().st_size > 0
+        except FileNotFoundError:
+            return False
+
+    def _get_articles_in_page(self, tree, executor, seen, force=False):
+        """
+        Get links from the category index and schedule each download.
+        Entries without a link or a date are counted as errors. Articles
+        already scheduled, e.g. listed in two categories or
+        shifted to the next page during the crawl, are counted as
+        existing instead of being downloaded twice.
 
         :params: tree: árbore lida da páxina de categoría
-        :returns: None
+        :params: executor: pool where the downloads are submitted
+        :params: seen: links already scheduled, updated in place
+        :params: force: download again the articles already on disk
+        :returns: dict: pending downloads mapped to the article link
+        """
+        downloads = {}
+        for a in _XP_ARTICLES_LIST(tree):
+            href = _XP_HEADLINE_HREF(a)
+            if not href:
+                self._count_download(href, False, "no link")
+                continue
+            href = href[0]
+            date = _XP_DATE(a)
+            if not date:
+                self._count_download(href, False, "no date")
+                continue
+            date = date[0]
+
+            if href in seen:
+                self._count_download(href, True, "exists")
+                continue
+            seen.add(href)
+
+            future = executor.submit(
+                self._download_article,
+                f"{self.config['base_url']}{href}",
+                date,
+                force,
+            )
+            downloads[future] = href
+
+        return downloads
+
+    def _count_download(self, href, result, msg):
         """
-        articles = tree.xpath(
-            '//ul[contains(@class, "articles-list")]//article'
-        )
+        Update the download counters with the result of an article.
 
-        for a in articles:
-            href = a.xpath('.//h2[contains(@class, "headline")]/a/@href')
-            if href:
-                href = href[0]
-            date = a.xpath('.//time[contains(@class, "date")]/@datetime')
-            if date:
-                date = date[0]
-
-            result, msg = self._download_article(
-                f"{self.config['base_url']}{href}", date)
-            if result:
-                if msg == "exists":
-                    self.articles_exists += 1
-                    logger.info("Article already exists: %s", href)
-                else:
-                    self.articles_ok += 1
-                    logger.info("Successfully downloaded article: %s", href)
+        :params: href: link of the article
+        :params: result: whether the download succeeded
+        :params: msg: status message returned by the download
+        :returns: None
+        """
+        if result:
+            if msg == "exists":
+                self.articles_exists += 1
+                logger.info("Article already exists: %s", href)
             else:
-                self.articles_error += 1
-                logger.error(
-                    "Error downloading article %s: %s", href, msg)
+                self.articles_ok += 1
+                logger.info("Successfully downloaded article: %s", href)
+        else:
+            self.articles_error += 1
+            logger.error("Error downloading article %s: %s", href, msg)
 
     def _get_category_end(self, tree):
         """
@@ -465,13 +639,33 @@ class Praza():
         :params: tree: árvore da página de categoria
         :returns: int: last page number
         """
-        links = tree.xpath(
-            '//nav[contains(@class, "at-pagination")]'
-            '//a[contains(@class, "pagination-link")]'
-        )
+        links = _XP_PAGINATION(tree)
 
         nav = [
             int(p.text_content()) for p in links if p.text_content().isdigit()
         ]
 
         return max(nav) if nav else 1
+
+
+_worker = None
+
+
+def _init_worker(config):
+    """
+    Create the Praza instance used by a worker process.
+
+    :param config: scraper configuration as a plain dict
+    """
+    global _worker
+    _worker = Praza(config)
+
+
+def _parse_one(html_file):
+    """
+    Parse one HTML file in a worker process.
+
+    :param html_file: Path to the HTML file
+    :returns: result of Praza._parse_file
+    """
+    return _worker._parse_file(html_file)
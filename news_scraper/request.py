@@ -2,8 +2,32 @@
 Request wrapper for fetching URLs with retry logic.
 """
 import logging
+import os
+import random
+import socket
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.models import DEFAULT_REDIRECT_LIMIT
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import (
+    ConnectTimeoutError,
+    MaxRetryError,
+    NewConnectionError,
+    ProtocolError,
+    ReadTimeoutError,
+)
+from urllib3.util import make_headers
+from urllib3.util.connection import allowed_gai_family, create_connection
+from urllib3.util.retry import Retry
 
 
 logger = logging.getLogger(__name__)
@@ -13,102 +37,397 @@ class RequestError(Exception):
     """Custom exception used for errors in the Request class."""
 
 
+class _Retry(Retry):
+    """
+    Retry policy that never retries a read timeout: the server already
+    received the request and may still be working on it.
+
+    Unlike urllib3, which retries the first failure immediately, it
+    waits backoff_factor * 2 ** (n - 1) seconds plus a random jitter
+    before the n-th retry. A Retry-After header still takes precedence.
+    """
+
+    def increment(
+        self,
+        method=None,
+        url=None,
+        response=None,
+        error=None,
+        _pool=None,
+        _stacktrace=None,
+    ):
+        if isinstance(error, ReadTimeoutError):
+            raise error.with_traceback(_stacktrace)
+        return super().increment(
+            method, url, response, error, _pool, _stacktrace)
+
+    def get_backoff_time(self):
+        # Redirects followed by a PoolManager are not failures.
+        retries = sum(1 for h in self.history if h.redirect_location is None)
+        if retries == 0:
+            return 0
+        backoff = self.backoff_factor * 2 ** (retries - 1)
+        backoff += random.uniform(0, self.backoff_jitter)
+        return min(self.backoff_max, backoff)
+
+
+class _DNSCache:
+    """
+    Thread-safe cache of getaddrinfo() results. The scrapers only talk
+    to one or two hosts, so each name is resolved once per TTL instead
+    of on every new connection.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def resolve(self, host, port):
+        """
+        :param host: host name to resolve.
+        :param port: port of the connection.
+        :return: list of socket addresses, in getaddrinfo() order.
+        :raises socket.gaierror: if the name cannot be resolved.
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        infos = socket.getaddrinfo(
+            host, port, allowed_gai_family(), socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        """
+        Drop the cached addresses of a host, so that the next connection
+        resolves it again.
+
+        :param host: host name to forget.
+        :param port: port of the connection.
+        """
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+_DNS_CACHE = _DNSCache()
+
+
+class _CachedDNSMixin:
+    """
+    Connection mixin that connects to the cached addresses of the host,
+    trying each one in turn like urllib3 does. Only the socket target
+    changes: the Host header, SNI, certificate checks and error messages
+    still use the host name. If no cached address accepts the connection
+    the entry is dropped, so the next attempt resolves the name again.
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = _DNS_CACHE.resolve(host, self.port)
+        except OSError:
+            addresses = None
+        if not addresses:
+            # Let urllib3 resolve it and report the error its own way.
+            return super()._new_conn()
+
+        for address in addresses:
+            try:
+                sock = create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except OSError as e:
+                error = e
+                continue
+            sys.audit("http.client.connect", self, self.host, self.port)
+            return sock
+
+        _DNS_CACHE.forget(host, self.port)
+        if isinstance(error, socket.timeout):
+            raise ConnectTimeoutError(
+                self,
+                f"Connection to {self.host} timed out. "
+                f"(connect timeout={self.timeout})",
+            ) from error
+        raise NewConnectionError(
+            self, f"Failed to establish a new connection: {error}"
+        ) from error
+
+
+class _CachedDNSHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class _CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDNSHTTPConnection
+
+
+class _CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+_CACHED_DNS_POOLS = {
+    "http": _CachedDNSHTTPConnectionPool,
+    "https": _CachedDNSHTTPSConnectionPool,
+}
+
+
+class _CachedDNSAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools resolve host names through the
+    shared DNS cache.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _CACHED_DNS_POOLS
+
+
+class _Urllib3Response:
+    """
+    Thin wrapper giving a urllib3 response the parts of the
+    requests.Response interface used by Request and its callers.
+    """
+
+    def __init__(self, response, url):
+        self.raw = response
+        self.url = url
+        self.status_code = response.status
+        self.headers = response.headers
+        self.encoding = get_encoding_from_headers(response.headers)
+        self._content = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self.raw.data
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", "replace")
+
+    def iter_content(self, chunk_size=1):
+        return self.raw.stream(chunk_size, decode_content=True)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                f"{self.status_code} Error for url: {self.url}",
+                response=self,
+            )
+
+    def close(self):
+        self.raw.release_conn()
+
+
 class Request:
     """
     Simple HTTP client for fetching URLs from newspapers and other
-    data sources.
+    data sources. Connections are kept alive through a shared session.
     """
 
+    # Statuses retried by the adapter; subclasses may assign another set.
+    _RETRY_STATUS = frozenset((500, 502, 503, 504, 429))
+
     def __init__(
         self,
         timeout=10,
         max_retries=3,
         retry_delay=2.0,
         user_agent="ProxectoNOSApp/1.0",
+        pool_connections=8,
+        pool_maxsize=32,
+        base_url=None,
+        backend="requests",
     ):
         """
         :param timeout: maximum number of seconds to wait for a response.
         :param max_retries: maximum number of attempts before giving up.
-        :param retry_delay: delay (in seconds) between retries.
+        :param retry_delay: backoff factor (in seconds) between retries,
+            unless the server sends a Retry-After header.
         :param user_agent: default User-Agent header for all requests.
+        :param pool_connections: number of per-host pools to keep.
+        :param pool_maxsize: connections kept alive per host, which should
+            be at least the number of threads sharing this instance.
+        :param base_url: optional URL of the site to be scraped, whose
+            host name is resolved in advance to warm the DNS cache.
+        :param backend: HTTP client to use, "requests" or "urllib3". The
+            latter skips the per-request work of requests (hooks, auth,
+            environment proxies) and talks to a urllib3 PoolManager.
+        :raises ValueError: if the backend is not known.
         """
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.user_agent = user_agent
+        self.pool_maxsize = pool_maxsize
+        self.backend = backend
+
+        # Every encoding urllib3 can decode here: br needs brotli.
+        self._headers = make_headers(
+            user_agent=user_agent, accept_encoding=True)
+        retry = _Retry(
+            total=max_retries - 1,
+            status_forcelist=self._RETRY_STATUS,
+            allowed_methods=["GET"],
+            backoff_factor=retry_delay,
+            backoff_jitter=0.5,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        if backend == "requests":
+            self._session = requests.Session()
+            self._session.headers.update(self._headers)
+            adapter = _CachedDNSAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=retry,
+                pool_block=False,
+            )
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        elif backend == "urllib3":
+            # PoolManager follows redirects itself and counts them against
+            # total: give each kind its own limit, with as many redirects
+            # as requests allows.
+            attempts = max_retries - 1
+            retry = retry.new(
+                total=None,
+                connect=attempts,
+                read=attempts,
+                status=attempts,
+                other=attempts,
+                redirect=DEFAULT_REDIRECT_LIMIT,
+            )
+            self._pool = urllib3.PoolManager(
+                num_pools=pool_connections,
+                maxsize=pool_maxsize,
+                block=False,
+                retries=retry,
+                headers=self._headers,
+            )
+            self._pool.pool_classes_by_scheme = _CACHED_DNS_POOLS
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        if base_url:
+            self._warm_dns(base_url)
 
-        self._retry_status_codes = {500, 502, 503, 504, 429}
+    def __enter__(self):
+        return self
 
-    def _request_with_retries(self, url, headers=None):
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
         """
-        Perform a GET request and return the raw Response object.
+        Close the underlying session and its pooled connections.
+        """
+        if self.backend == "urllib3":
+            self._pool.clear()
+        else:
+            self._session.close()
 
-        :param url: URL to fetch.
-        :param headers: optional extra headers to send with the request.
-        :raises RequestError: when all attempts fail.
-        :return: a requests.Response object.
+    def _warm_dns(self, url):
         """
-        merged_headers = {"User-Agent": self.user_agent}
-        if headers:
-            merged_headers.update(headers)
+        Resolve the host of url into the DNS cache. A failure is only
+        logged, as it will be retried when the first connection is made.
 
-        last_exc = None
+        :param url: URL whose host name should be resolved.
+        """
+        parts = urlsplit(url)
+        if not parts.hostname:
+            return
+        port = parts.port or (80 if parts.scheme == "http" else 443)
+        try:
+            _DNS_CACHE.resolve(parts.hostname, port)
+        except OSError as e:
+            logger.debug("Could not resolve %s: %s", parts.hostname, e)
 
-        for attempt in range(1, self.max_retries + 1):
-            try:
-                logger.debug(
-                    "Fetching URL: %s (attempt %d)",
-                    url,
-                    attempt,
-                )
-                response = requests.get(
-                    url,
-                    timeout=self.timeout,
-                    headers=merged_headers,
-                )
+    def _request_with_retries(self, url, headers=None, stream=False):
+        """
+        Perform a GET request and return the raw Response object.
+        Retries and backoff are handled by the session adapter.
 
-                status = response.status_code
-
-                if (
-                    status in self._retry_status_codes
-                    and attempt < self.max_retries
-                ):
-                    logger.warning(
-                        "Got status code %d for %s, retrying (attempt #%d)...",
-                        status,
-                        url,
-                        attempt + 1,
-                    )
-                    time.sleep(self.retry_delay)
-                    continue
-
-                return response
-
-            except (
-                requests.Timeout,
-                requests.ConnectionError,
-                requests.RequestException,
-            ) as e:
-                last_exc = e
-                logger.error(
-                    "Error fetching the URL %s (attempt %d): %s",
-                    url,
-                    attempt,
-                    e,
-                )
-                if attempt < self.max_retries:
-                    time.sleep(self.retry_delay)
-                else:
-                    break
+        :param url: URL to fetch.
+        :param headers: optional extra headers, merged over the defaults
+            (User-Agent, Accept-Encoding).
+        :param stream: defer downloading the body until it is consumed.
+        :raises RequestError: when all attempts fail.
+        :return: a requests.Response object, or a look-alike wrapping the
+            urllib3 response.
+        """
+        logger.debug("Fetching URL: %s", url)
+        if self.backend == "urllib3":
+            return self._urllib3_request(url, headers, stream)
+        try:
+            return self._session.get(
+                url,
+                timeout=self.timeout,
+                headers=headers,
+                stream=stream,
+            )
+        except requests.RequestException as e:
+            logger.error("Error fetching the URL %s: %s", url, e)
+            if isinstance(e, requests.Timeout):
+                raise RequestError("Timeout occurred") from e
+            if isinstance(e, requests.ConnectionError):
+                raise RequestError("Connection error occurred") from e
+            raise RequestError(f"Error fetching URL: {e}") from e
 
-        if isinstance(last_exc, requests.Timeout):
-            raise RequestError("Timeout occurred")
-        if isinstance(last_exc, requests.ConnectionError):
-            raise RequestError("Connection error occurred")
-        if last_exc is not None:
-            raise RequestError(f"Error fetching URL: {last_exc}")
+    def _urllib3_request(self, url, headers, stream):
+        """
+        Perform a GET request through the urllib3 backend.
 
-        raise RequestError("Unknown error fetching URL")
+        :param url: URL to fetch.
+        :param headers: optional extra headers.
+        :param stream: defer downloading the body until it is consumed.
+        :raises RequestError: when all attempts fail.
+        :return: a _Urllib3Response object.
+        """
+        if headers:
+            # Case-insensitive, so a caller's User-Agent replaces ours.
+            merged = urllib3.HTTPHeaderDict(self._headers)
+            merged.update(headers)
+            headers = merged
+        try:
+            response = self._pool.request(
+                "GET",
+                url,
+                headers=headers,
+                timeout=self.timeout,
+                preload_content=not stream,
+            )
+        except urllib3.exceptions.HTTPError as e:
+            logger.error("Error fetching the URL %s: %s", url, e)
+            reason = e.reason if isinstance(e, MaxRetryError) else e
+            if isinstance(reason, (NewConnectionError, ProtocolError)):
+                raise RequestError("Connection error occurred") from e
+            if isinstance(reason, urllib3.exceptions.TimeoutError):
+                raise RequestError("Timeout occurred") from e
+            raise RequestError(f"Error fetching URL: {e}") from e
+        return _Urllib3Response(response, url)
 
     def fetch_response(self, url, headers=None):
         """
@@ -120,11 +439,13 @@ class Request:
         :raises RequestError: if the request fails after all retries.
         """
         response = self._request_with_retries(url, headers=headers)
-        logger.info(
-            "Fetched URL %s with status %d",
-            url,
-            response.status_code,
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Fetched URL %s with status %d",
+                url,
+                response.status_code,
+            )
+        self._log_compression(response, url)
         return response
 
     def fetch(self, url, headers=None):
@@ -136,12 +457,110 @@ class Request:
         :return: response body as a string.
         :raises RequestError: if the request fails or HTTP status is not OK.
         """
-        response = self._request_with_retries(url, headers=headers)
+        response = self.fetch_response(url, headers=headers)
+        self._raise_for_status(response, url)
+        return response.text
 
+    def fetch_bytes(self, url, headers=None):
+        """
+        Fetch a URL and return the response body without decoding it,
+        e.g. for images or other binary files.
+
+        :param url: URL to fetch.
+        :param headers: optional extra headers.
+        :return: response body as bytes.
+        :raises RequestError: if the request fails or HTTP status is not OK.
+        """
+        response = self.fetch_response(url, headers=headers)
+        self._raise_for_status(response, url)
+        return response.content
+
+    def fetch_to_file(self, url, dest_path, headers=None, chunk_size=65536):
+        """
+        Fetch a URL and stream the response body into a file, keeping
+        only one chunk in memory. The body is first written to a uniquely
+        named ".part" file next to dest_path, which is renamed once
+        complete, so an interrupted download never leaves a truncated
+        file behind and concurrent downloads of the same URL do not
+        overwrite each other's data.
+
+        :param url: URL to fetch.
+        :param dest_path: path of the file to write.
+        :param headers: optional extra headers.
+        :param chunk_size: size in bytes of each chunk read.
+        :return: number of bytes written (nothing is written if 0).
+        :raises RequestError: if the request fails or HTTP status is not OK.
+        """
+        dest_path = Path(dest_path)
+        response = self._request_with_retries(
+            url, headers=headers, stream=True)
+
+        size = 0
+        with response:
+            self._raise_for_status(response, url)
+            # A random name, created exclusively, with the usual umask.
+            tmp_path = dest_path.with_name(
+                f"{dest_path.name}.{os.urandom(6).hex()}.part")
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            with os.fdopen(fd, "wb") as f:
+                try:
+                    for chunk in response.iter_content(chunk_size):
+                        f.write(chunk)
+                        size += len(chunk)
+                except (
+                    requests.RequestException,
+                    urllib3.exceptions.HTTPError,
+                ) as e:
+                    f.close()
+                    tmp_path.unlink(missing_ok=True)
+                    logger.error("Error reading the body of %s: %s", url, e)
+                    raise RequestError(f"Error fetching URL: {e}") from e
+                except OSError:
+                    f.close()
+                    tmp_path.unlink(missing_ok=True)
+                    raise
+
+        if size:
+            tmp_path.replace(dest_path)
+        else:
+            tmp_path.unlink()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Successfully fetched URL: %s", url)
+        return size
+
+    def _log_compression(self, response, url):
+        """
+        Log at DEBUG how much the body shrank on the wire, when the
+        server sends its compressed length.
+
+        :param response: a requests.Response whose body has been read.
+        :param url: URL that was fetched.
+        """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        wire = response.headers.get("Content-Length")
+        if not wire or not wire.isdigit() or not int(wire):
+            return
+        size = len(response.content)
+        logger.debug(
+            "Fetched %s: %d bytes from %s on the wire (%s, ratio %.1f)",
+            url,
+            size,
+            wire,
+            response.headers.get("Content-Encoding", "identity"),
+            size / int(wire),
+        )
+
+    def _raise_for_status(self, response, url):
+        """
+        Raise a RequestError if the response has an HTTP error status.
+
+        :param response: a requests.Response object.
+        :param url: URL that was fetched.
+        :raises RequestError: if HTTP status is not OK.
+        """
         try:
             response.raise_for_status()
-            logger.info("Successfully fetched URL: %s", url)
-            return response.text
         except requests.HTTPError as e:
             status = response.status_code
             logger.error(
@@ -151,3 +570,27 @@ class Request:
                 status,
             )
             raise RequestError(f"HTTP {status} error in {url}") from e
+
+    def fetch_many(self, urls, executor=None):
+        """
+        Fetch several URLs concurrently, yielding each body as it arrives.
+
+        Concurrency is bounded by the executor, or by pool_maxsize when
+        a private thread pool is created for the call.
+
+        :param urls: URLs to fetch.
+        :param executor: optional executor to submit the requests to.
+        :return: iterator of (url, body) tuples in completion order; body
+            is None when the request failed.
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.pool_maxsize) as ex:
+                yield from self.fetch_many(urls, ex)
+            return
+
+        futures = {executor.submit(self.fetch, url): url for url in urls}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except RequestError:
+                yield futures[future], None
@@ -3,25 +3,76 @@ Script para descarregar artigos de jornais galegos.
 """
 import argparse
 import configparser
+import functools
 import logging
+import os
 import sys
-from pathlib import Path
-from news_scraper.prazapublica import Praza, CATEGORIES
+import types
+from news_scraper.prazapublica import Praza, CATEGORY_NAMES
 from news_scraper.nosdiario import NosDiario
 
 logger = logging.getLogger(__name__)
 
+SOURCES = {
+    "praza": (Praza, ".html"),
+    "nosdiario": (NosDiario, ".xml"),
+}
 
+
+@functools.lru_cache(maxsize=1)
 def load_config(path="config.ini"):
     """
-    Carrega a configuração do ficheiro INI.
+    Carrega a configuração do ficheiro INI (só uma vez por ficheiro).
 
     :param path: ficheiro de configuração
-    :returns: objeto ConfigParser com a configuração
+    :returns: mapeamento só de leitura de cada secção para um dict
     """
     cfg = configparser.ConfigParser()
     cfg.read(path, encoding="utf-8")
-    return cfg
+    return types.MappingProxyType(
+        {s: dict(cfg[s]) for s in cfg.sections()})
+
+
+def walk(root, suffix):
+    """
+    Percorre recursivamente root com os.scandir, sem criar objetos Path.
+
+    :param root: directorio inicial
+    :param suffix: extensão dos ficheiros a devolver
+    :returns: iterador dos paths (str) dos ficheiros com essa extensão;
+        os directórios que não se podem ler apenas se registam no log
+    """
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            it = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+            logger.warning("Cannot read directory %s: %s", path, e)
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(suffix):
+                    yield entry.path
+
+
+def positive_int(value):
+    """
+    Tipo de argparse para inteiros maiores que zero.
+
+    :param value: valor da linha de comandos
+    :returns: o valor como int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            f"'{value}' não é um inteiro positivo")
+    return number
 
 
 def parse_args():
@@ -39,6 +90,14 @@ def parse_args():
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         help="Define o nivel de registo.",
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=positive_int,
+        default=os.cpu_count(),
+        metavar="N",
+        help="Número de procesos para parsear (por defecto: un por CPU).",
+    )
 
     subparsers = parser.add_subparsers(
         title="source",
@@ -55,10 +114,16 @@ def parse_args():
         "--category",
         "-c",
         nargs="+",
-        choices=sorted(CATEGORIES.keys()),
-        default=sorted(CATEGORIES.keys()),
+        choices=CATEGORY_NAMES,
+        default=CATEGORY_NAMES,
         help="Categorias para descarregar.",
     )
+    praza_parser.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="Volver descarregar os artigos que xa existen en disco.",
+    )
     group_p.add_argument(
         "--download",
         "-d",
@@ -121,18 +186,18 @@ def main(args):
 
     :params: args: argumentos da linha de comandos
     """
-    def parse_paths(args, config, pattern):
+    def parse_paths(args, config, suffix):
         """
         Retorna os paths a parsear segundo os argumentos.
 
         :params: args: argumentos da linha de comandos
         :params: config: configuração do scraper
-        :params: pattern: extensão dos ficheiros a parsear
+        :params: suffix: extensão dos ficheiros a parsear
         :returns: lista de paths a parsear
         """
         if args.parse == "ALL":
-            return Path(config["source"]).rglob(pattern)
-        return [Path(args.parse)]
+            return sorted(walk(config["source"], suffix))
+        return [args.parse]
 
     try:
         config = load_config()[args.source]
@@ -140,33 +205,32 @@ def main(args):
         logger.error("No configuration found for source: %s", args.source)
         sys.exit(1)
 
-    if args.source == "praza":
-        p = Praza(config=config)
-        pattern = "*.html"
-    elif args.source == "nosdiario":
-        p = NosDiario(config=config)
-        pattern = "*.xml"
-    else:
-        raise ValueError(f"Unknown source: {args.source}")
-
-    if args.parse:
-        p.parse(parse_paths(args, config, pattern))
-        print(
-            f"Parsed {p.articles_ok + p.articles_error} articles, "
-            f"{p.articles_error} with errors"
-        )
+    cls, suffix = SOURCES[args.source]
+    p = cls(config=config)
+
+    with p:
+        if args.parse:
+            p.parse(parse_paths(args, config, suffix), workers=args.workers)
+            print(
+                f"Parsed {p.articles_ok + p.articles_error} articles, "
+                f"{p.articles_error} with errors"
+            )
 
-    elif args.source == "praza" and args.download:
-        if args.download == "rss":
-            raise RuntimeError("rss not implemented yet")
-        for category in args.category:
-            logger.info("Fetching category: %s", category)
-            p.download_from_category(category)
+        elif args.source == "praza" and args.download:
+            if args.download == "rss":
+                raise RuntimeError("rss not implemented yet")
+            logger.info("Fetching categories: %s", ", ".join(args.category))
+            p.download_urls(
+                p.iter_category_urls(args.category), force=args.force)
 
 
 if __name__ == "__main__":
     p_args = parse_args()
 
+    # The log format uses none of these, so skip collecting them.
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging._srcfile = None
     logging.basicConfig(
         level=getattr(logging, p_args.loglevel),
         format="[%(levelname)s] %(name)s: %(message)s"